@@ -0,0 +1,304 @@
+"""
+ASGI API server for RAG Chatbot
+Async counterpart of app.py exposing the same /api/* endpoints.
+Run with: uvicorn asgi:app --host 0.0.0.0 --port 5000
+"""
+from quart import Quart, request, jsonify, send_from_directory
+from quart_cors import cors
+from processing import RAG
+import asyncio
+import datetime
+import os
+from dotenv import load_dotenv
+import logging
+
+# Load environment variables
+load_dotenv()
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Get paths
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+FRONTEND_DIR = os.path.join(os.path.dirname(BACKEND_DIR), 'frontend')
+
+# Initialize Quart app with static folder config
+app = Quart(__name__, static_folder=FRONTEND_DIR, static_url_path='')
+app = cors(app)  # Enable CORS for frontend requests
+
+# Initialize RAG system
+rag_instance = None
+initialization_done = False
+initialization_error = None
+_init_lock = asyncio.Lock()
+_background_tasks = set()
+
+
+async def initialize_rag():
+    """Initialize RAG system on first request (model load runs off the event loop)"""
+    global rag_instance, initialization_done, initialization_error
+
+    async with _init_lock:
+        if initialization_done:
+            return rag_instance
+
+        try:
+            logger.info("Initializing RAG system...")
+            loop = asyncio.get_running_loop()
+            rag_instance = await loop.run_in_executor(None, RAG)
+            if os.getenv('FORCE_INDEX', 'false').lower() == 'true':
+                logger.info("FORCE_INDEX enabled — creating Vector DB now...")
+                await loop.run_in_executor(None, rag_instance.create_vectordb)
+
+            initialization_done = True
+            initialization_error = None
+            logger.info("RAG system initialized (indexing skipped by default).")
+            return rag_instance
+        except Exception as e:
+            logger.error(f"Error initializing RAG: {str(e)}")
+            initialization_error = str(e)
+            return None
+
+
+async def _read_question():
+    """Return (question, error_response) from the JSON body"""
+    data = await request.get_json(silent=True)
+
+    if not data or 'question' not in data:
+        return None, (jsonify({
+            'status': 'error',
+            'message': 'Missing "question" field in request'
+        }), 400)
+
+    question = data['question'].strip()
+
+    if not question:
+        return None, (jsonify({
+            'status': 'error',
+            'message': 'Question cannot be empty'
+        }), 400)
+
+    return question, None
+
+
+@app.after_serving
+async def shutdown():
+    """Close pooled clients on server shutdown"""
+    if rag_instance is not None:
+        await rag_instance.aclose()
+
+
+@app.route('/', methods=['GET'])
+async def serve_index():
+    """Serve index.html as the root"""
+    return await send_from_directory(FRONTEND_DIR, 'index.html')
+
+
+@app.route('/<path:filename>', methods=['GET'])
+async def serve_static(filename):
+    """Serve static files (CSS, JS, etc.)"""
+    return await send_from_directory(FRONTEND_DIR, filename)
+
+
+@app.route('/api/health', methods=['GET'])
+async def health_check():
+    """Health check endpoint"""
+    return jsonify({
+        'status': 'ok',
+        'rag_initialized': initialization_done,
+        'error': initialization_error
+    })
+
+
+@app.route('/api/initialize', methods=['POST'])
+async def initialize():
+    """Initialize RAG system"""
+    if initialization_done:
+        return jsonify({
+            'status': 'success',
+            'message': 'RAG system already initialized'
+        })
+
+    rag = await initialize_rag()
+
+    if rag is None:
+        return jsonify({
+            'status': 'error',
+            'message': 'Failed to initialize RAG system',
+            'error': initialization_error
+        }), 500
+
+    return jsonify({
+        'status': 'success',
+        'message': 'RAG system initialized successfully'
+    })
+
+
+@app.route('/api/index', methods=['POST'])
+async def trigger_index():
+    """Trigger vector DB creation (indexing) in background."""
+    if not initialization_done:
+        return jsonify({'status': 'error', 'message': 'RAG not initialized'}), 503
+
+    async def _run_index():
+        try:
+            logger.info('Background indexing started')
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, rag_instance.create_vectordb)
+            logger.info('Background indexing finished')
+        except Exception as e:
+            logger.error(f'Indexing error: {e}')
+
+    # Keep a reference so the task is not garbage-collected mid-run
+    task = asyncio.create_task(_run_index())
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+    return jsonify({'status': 'accepted', 'message': 'Indexing started in background'})
+
+
+@app.route('/api/chat', methods=['POST'])
+async def chat():
+    """
+    Main chat endpoint
+    Expected JSON: {
+        "question": "user question here"
+    }
+    """
+    try:
+        # Initialize RAG if not already done
+        if not initialization_done:
+            rag = await initialize_rag()
+            if rag is None:
+                return jsonify({
+                    'status': 'error',
+                    'message': 'Failed to initialize RAG system',
+                    'error': initialization_error
+                }), 500
+
+        question, error = await _read_question()
+        if error:
+            return error
+
+        logger.info(f"Processing question: {question}")
+
+        # Generate response using RAG
+        response = await rag_instance.agenerate_response(question)
+
+        return jsonify({
+            'status': 'success',
+            'question': question,
+            'answer': response,
+            'timestamp': datetime.datetime.now().isoformat()
+        })
+
+    except Exception as e:
+        logger.error(f"Error processing chat request: {str(e)}")
+        return jsonify({
+            'status': 'error',
+            'message': 'Error processing request',
+            'error': str(e)
+        }), 500
+
+
+@app.route('/api/chat/stream', methods=['POST'])
+async def chat_stream():
+    """
+    Streaming chat endpoint (for future use)
+    Allows real-time streaming of responses
+    """
+    try:
+        # Initialize RAG if not already done
+        if not initialization_done:
+            rag = await initialize_rag()
+            if rag is None:
+                return jsonify({
+                    'status': 'error',
+                    'message': 'Failed to initialize RAG system'
+                }), 500
+
+        question, error = await _read_question()
+        if error:
+            return error
+
+        # Generate response
+        response = await rag_instance.agenerate_response(question)
+
+        return jsonify({
+            'status': 'success',
+            'question': question,
+            'answer': response
+        })
+
+    except Exception as e:
+        logger.error(f"Error in streaming endpoint: {str(e)}")
+        return jsonify({
+            'status': 'error',
+            'message': 'Error processing request',
+            'error': str(e)
+        }), 500
+
+
+@app.route('/api/articles/<int:article_number>', methods=['GET'])
+async def get_article(article_number):
+    """Get specific article from law"""
+    try:
+        if not initialization_done:
+            return jsonify({
+                'status': 'error',
+                'message': 'RAG system not initialized'
+            }), 503
+
+        query = f"Điều {article_number}"
+        response = rag_instance.search_raw_article(query)
+
+        if response:
+            return jsonify({
+                'status': 'success',
+                'article': article_number,
+                'content': response
+            })
+        else:
+            return jsonify({
+                'status': 'error',
+                'message': f'Article {article_number} not found'
+            }), 404
+
+    except Exception as e:
+        logger.error(f"Error fetching article: {str(e)}")
+        return jsonify({
+            'status': 'error',
+            'message': 'Error fetching article',
+            'error': str(e)
+        }), 500
+
+
+@app.errorhandler(404)
+async def not_found(e):
+    """Handle 404 errors"""
+    return jsonify({
+        'status': 'error',
+        'message': 'Endpoint not found'
+    }), 404
+
+
+@app.errorhandler(500)
+async def server_error(e):
+    """Handle 500 errors"""
+    logger.error(f"Server error: {str(e)}")
+    return jsonify({
+        'status': 'error',
+        'message': 'Internal server error'
+    }), 500
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    # Same host/port settings as the Flask server
+    host = os.getenv('FLASK_HOST', '0.0.0.0')
+    port = int(os.getenv('FLASK_PORT', 5000))
+
+    logger.info(f"Starting ASGI server on {host}:{port}")
+    uvicorn.run(app, host=host, port=port)
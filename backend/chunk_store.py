@@ -0,0 +1,159 @@
+"""
+Local chunk store for the RAG Chatbot
+Keeps chunk text on disk as one contiguous UTF-8 blob plus an offset/length
+array keyed by vector ID, so the vector index only needs to return IDs.
+"""
+from array import array
+import json
+import mmap
+import os
+import threading
+import time
+
+
+class ChunkStore:
+    CURRENT_FILE = "CURRENT"
+    BLOB_SUFFIX = ".bin"
+    OFFSETS_SUFFIX = ".offsets"
+    IDS_SUFFIX = ".ids.json"
+    # How often readers check CURRENT for a version published by another process
+    REFRESH_INTERVAL = 1.0
+
+    def __init__(self, folder):
+        self.folder = folder
+        # (version, positions, view) swapped as a single reference, so readers
+        # always see a consistent state without taking a lock
+        self._state = None
+        self._write_lock = threading.Lock()
+        self._next_check = 0.0
+        self.open()
+
+    @property
+    def available(self):
+        self._maybe_refresh()
+        return self._state is not None
+
+    def _path(self, version, suffix):
+        return os.path.join(self.folder, f"chunks-{version}{suffix}")
+
+    def _current_version(self):
+        current_path = os.path.join(self.folder, self.CURRENT_FILE)
+        if not os.path.exists(current_path):
+            return None
+        with open(current_path, "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+
+    def _load(self, version):
+        with open(self._path(version, self.IDS_SUFFIX), "r", encoding="utf-8") as f:
+            ids = json.load(f)
+        offsets = array("Q")
+        with open(self._path(version, self.OFFSETS_SUFFIX), "rb") as f:
+            offsets.frombytes(f.read())
+
+        # offsets holds (offset, length) pairs, one per ID
+        positions = {
+            vector_id: (offsets[2 * i], offsets[2 * i + 1])
+            for i, vector_id in enumerate(ids)
+        }
+
+        # The mapping stays valid after the file object is closed
+        with open(self._path(version, self.BLOB_SUFFIX), "rb") as f:
+            if os.fstat(f.fileno()).st_size > 0:
+                view = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+            else:
+                view = memoryview(b"")
+        return version, positions, view
+
+    def _remove_stale_versions(self, keep):
+        for file in os.listdir(self.folder):
+            if file.startswith("chunks-") and not file.startswith(f"chunks-{keep}."):
+                try:
+                    os.remove(os.path.join(self.folder, file))
+                except OSError:
+                    # Still mapped by a reader on Windows; retried on next build
+                    pass
+
+    def open(self, blocking=True):
+        """Memory-map the current version if the store has been built."""
+        if not self._write_lock.acquire(blocking=blocking):
+            # A build is in progress in this process; it swaps in its own state
+            return
+        try:
+            version = self._current_version()
+            state = self._state
+            if version is None or (state is not None and state[0] == version):
+                return
+            try:
+                state = self._load(version)
+            except FileNotFoundError:
+                # Superseded and removed by a newer build; picked up next check
+                return
+            self._state = state
+        finally:
+            self._write_lock.release()
+        print(f"[DEBUG] Chunk store: {len(state[1])} chunk")
+
+    def _maybe_refresh(self):
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + self.REFRESH_INTERVAL
+        self.open(blocking=False)
+
+    def close(self):
+        # Old mappings are released by GC once no reader holds a slice;
+        # closing them explicitly would fail while slices are exported.
+        self._state = None
+
+    def get(self, vector_id):
+        """Return chunk text for a vector ID, or None if unknown."""
+        self._maybe_refresh()
+        state = self._state
+        if state is None:
+            return None
+        _, positions, view = state
+        position = positions.get(vector_id)
+        if position is None:
+            return None
+        offset, length = position
+        # Slicing the memoryview does not copy; only the decode allocates
+        return str(view[offset:offset + length], "utf-8")
+
+    def build(self, items):
+        """Write (vector_id, text) pairs to a new version and swap it in.
+        The previous version keeps serving reads until the swap.
+        Later duplicates of an ID win, matching upsert semantics."""
+        os.makedirs(self.folder, exist_ok=True)
+        with self._write_lock:
+            version = f"{time.time_ns():x}"
+
+            ids, index, offsets = [], {}, array("Q")
+            with open(self._path(version, self.BLOB_SUFFIX), "wb") as f:
+                position = 0
+                for vector_id, text in items:
+                    data = text.encode("utf-8")
+                    f.write(data)
+                    if vector_id in index:
+                        i = index[vector_id]
+                        offsets[2 * i], offsets[2 * i + 1] = position, len(data)
+                    else:
+                        index[vector_id] = len(ids)
+                        ids.append(vector_id)
+                        offsets.extend((position, len(data)))
+                    position += len(data)
+
+            with open(self._path(version, self.OFFSETS_SUFFIX), "wb") as f:
+                f.write(offsets.tobytes())
+            with open(self._path(version, self.IDS_SUFFIX), "w", encoding="utf-8") as f:
+                json.dump(ids, f, ensure_ascii=False)
+
+            self._state = self._load(version)
+
+            # Publish the new version last so a crash never points at partial files
+            current_tmp = os.path.join(self.folder, f"{self.CURRENT_FILE}.{os.getpid()}.tmp")
+            with open(current_tmp, "w", encoding="utf-8") as f:
+                f.write(version)
+            os.replace(current_tmp, os.path.join(self.folder, self.CURRENT_FILE))
+
+            self._remove_stale_versions(keep=version)
+        print(f"[DEBUG] Chunk store: {len(ids)} chunk")
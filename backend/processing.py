@@ -6,15 +6,38 @@ import os
 import re
 from sentence_transformers import SentenceTransformer
 from pinecone import Pinecone, ServerlessSpec
-from collections import OrderedDict
+from collections import OrderedDict, Counter
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 import warnings
+import asyncio
+import atexit
+import hashlib
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import httpx
 from rapidfuzz import fuzz
+from chunk_store import ChunkStore
 warnings.filterwarnings('ignore')
 
 load_dotenv()
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
+OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3.1")
+OLLAMA_TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", "120"))
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+PROMPT_TEMPLATE = """
+            Bạn là chuyên gia rất am hiểu về Luật BHYT. Dựa trên Ngữ cảnh được cung cấp bên dưới, trả lời câu hỏi một cách thật chính xác và ngắn gọn.
+            BẮT BUỘC phải trích dẫn điều luật chính xác nếu có trong ngữ cảnh (Không được sai sót về số điều luật). 
+            Ngữ cảnh: {context}
+            Câu hỏi: {query}
+        """
+RAG_CACHE_DIR = os.getenv(
+    "RAG_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache")
+)
+QUERY_LOG_FLUSH_EVERY = 20
+QUERY_LOG_MAX_BYTES = int(os.getenv("RAG_QUERY_LOG_MAX_BYTES", str(5 * 1024 * 1024)))
 
 
 class RAG:
@@ -23,7 +46,7 @@ class RAG:
 
         self.data_folder = data_folder
         print("[DEBUG] Load model embedding...")
-        self.vector_model = SentenceTransformer("all-MiniLM-L6-v2")
+        self.vector_model = SentenceTransformer(EMBEDDING_MODEL)
 
         self.pinecone = Pinecone(api_key=PINECONE_API_KEY)
         self.index_name = "my-vector-db"
@@ -52,13 +75,49 @@ class RAG:
         self.http.mount("http://", adapter)
         self.http.mount("https://", adapter)
 
+        # Async HTTP client for the ASGI serving path. Created lazily inside the
+        # running event loop (see _get_async_http) so it is bound to that loop.
+        self._async_http = None
+        # Dedicated pool for CPU-bound embedding and blocking Pinecone calls so
+        # they never stall the event loop.
+        self._executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv("RAG_EXECUTOR_WORKERS", "4")),
+            thread_name_prefix="rag",
+        )
+
         # Simple in-memory LRU cache for query embeddings/results
         self._embed_cache = OrderedDict()
         self._embed_cache_max = 128
+        # Embeddings are computed on several executor threads at once
+        self._embed_cache_lock = threading.Lock()
         # Simple in-memory LRU cache for full query -> response
         self._response_cache = OrderedDict()
         self._response_cache_max = 256
 
+        # Precomputed (warm) caches produced offline by warm_up() and persisted
+        # to disk. Unlike the LRU caches above they are never evicted.
+        os.makedirs(RAG_CACHE_DIR, exist_ok=True)
+        self._warm_cache_path = os.path.join(RAG_CACHE_DIR, "warm_cache.json")
+        self._query_log_path = os.path.join(RAG_CACHE_DIR, "queries.log")
+        # Queries are buffered in memory and appended to disk in batches on the
+        # executor, so logging never does file I/O on the event loop.
+        self._query_log_buffer = []
+        self._query_log_lock = threading.Lock()
+        self._query_log_file_lock = threading.Lock()
+        atexit.register(self.flush_query_log)
+        self._load_warm_cache()
+
+        # Chunk text lives in a local memory-mapped store; the vector index only
+        # returns IDs and scores.
+        self.chunk_store = ChunkStore(os.path.join(RAG_CACHE_DIR, "chunks"))
+        if not self.chunk_store.available:
+            # Fresh clone/container: the index exists remotely but the local
+            # store is gitignored, so rebuild it from the data files.
+            try:
+                self.build_chunk_store()
+            except Exception as e:
+                print(f"[DEBUG] Không tạo được chunk store: {e}")
+
         # Load law text once to speed up raw article search
         law_path = os.path.join(self.data_folder, "law.txt")
         self._law_text = None
@@ -239,7 +298,6 @@ class RAG:
                 "page": doc.metadata["page"],
                 "chunk": doc.metadata["chunk"],
                 "filename": doc.metadata["filename"],
-                "text": doc.page_content,
             }
 
             batch.append((doc.metadata["source"], embedding, metadata))
@@ -257,8 +315,7 @@ class RAG:
     # ======================
     #    Tạo vector DB
     # ======================
-    def create_vectordb(self):
-        print("[DEBUG] Tạo vector DB từ thư mục:", self.data_folder)
+    def load_documents(self):
         documents = []
 
         for file in os.listdir(self.data_folder):
@@ -270,99 +327,400 @@ class RAG:
                 documents.extend(docs)
 
         print(f"[DEBUG] Tổng số doc chunk: {len(documents)}")
+        return documents
+
+    def build_chunk_store(self, documents=None):
+        """Rebuild the local chunk store from data_folder (no embedding/upsert)."""
+        if documents is None:
+            documents = self.load_documents()
+        self.chunk_store.build((doc.metadata["source"], doc.page_content) for doc in documents)
+
+    def create_vectordb(self, warm=None):
+        print("[DEBUG] Tạo vector DB từ thư mục:", self.data_folder)
+        documents = self.load_documents()
         self.docs_to_index(documents)
+        # Publish the chunk text only once the vectors it belongs to are upserted
+        self.build_chunk_store(documents)
+
+        # Old warm answers/retrievals refer to the previous index: rebuild them,
+        # or drop them so they are not served against the new data
+        if warm is None:
+            warm = os.getenv("WARM_UP_AFTER_INDEX", "false").lower() == "true"
+        if warm:
+            self.warm_up()
+        else:
+            self._clear_warm_cache()
 
 
     # ======================
     #       Truy vấn
     # ======================
-    def retrieve_relevant_docs(self, query, top_k=3, threshold=0.35):
-        print(f"[DEBUG] Truy vấn: {query}")
+    @staticmethod
+    def _cache_key(query):
+        # Single normalization for every cache lookup and the query log
+        return " ".join(query.split())
+
+    def _embed_query(self, query):
         # Use simple LRU cache for embeddings to avoid recomputing identical queries
-        if query in self._embed_cache:
-            embedding = self._embed_cache.pop(query)
-            # move to end to mark as most recently used
-            self._embed_cache[query] = embedding
-        else:
-            embedding = self.vector_model.encode([query])[0].tolist()
-            self._embed_cache[query] = embedding
+        key = self._cache_key(query)
+        with self._embed_cache_lock:
+            if key in self._embed_cache:
+                # move to end to mark as most recently used
+                self._embed_cache.move_to_end(key)
+                return self._embed_cache[key]
+        if key in self._warm_cache["embeddings"]:
+            return self._warm_cache["embeddings"][key]
+
+        # Encode outside the lock so concurrent queries are not serialized
+        embedding = self.vector_model.encode([key])[0].tolist()
+        with self._embed_cache_lock:
+            self._embed_cache[key] = embedding
             if len(self._embed_cache) > self._embed_cache_max:
                 self._embed_cache.popitem(last=False)
+        return embedding
+
+    def _fetch_matches(self, embedding, top_k):
+        # Metadata is only needed for indexes built before the local chunk store
+        with_metadata = not self.chunk_store.available
+        res = self.index.query(vector=embedding, top_k=top_k, include_metadata=with_metadata)
+        # Plain dicts so results can be persisted in the warm cache
+        matches = []
+        for m in res["matches"]:
+            match = {"id": m["id"], "score": m["score"]}
+            if with_metadata and m.get("metadata"):
+                match["metadata"] = dict(m["metadata"])
+            matches.append(match)
+        return matches
 
-        res = self.index.query(vector=embedding, top_k=top_k, include_metadata=True)
+    def _doc_text(self, match):
+        text = self.chunk_store.get(match["id"])
+        if text is None:
+            text = match.get("metadata", {}).get("text")
+        if text is None:
+            print(f"[DEBUG] Không tìm thấy nội dung chunk {match['id']} → bỏ qua")
+        return text
+
+    def _query_index(self, query, embedding, top_k, threshold):
+        warm = self._warm_cache["retrieval"].get(self._cache_key(query))
+        if warm is not None and warm["top_k"] >= top_k:
+            print("[DEBUG] Dùng kết quả truy vấn từ warm cache")
+            matches = warm["matches"][:top_k]
+        else:
+            matches = self._fetch_matches(embedding, top_k)
 
-        print("[DEBUG] Kết quả top-k:", len(res["matches"]))
+        print("[DEBUG] Kết quả top-k:", len(matches))
 
-        matches = [m for m in res["matches"] if m["score"] >= threshold]
+        matches = [m for m in matches if m["score"] >= threshold]
         print(f"[DEBUG] Sau threshold {threshold}: còn {len(matches)} kết quả")
 
         return matches
 
+    def retrieve_relevant_docs(self, query, top_k=3, threshold=0.35):
+        print(f"[DEBUG] Truy vấn: {query}")
+        embedding = self._embed_query(query)
+        return self._query_index(query, embedding, top_k, threshold)
+
+    async def aretrieve_relevant_docs(self, query, top_k=3, threshold=0.35):
+        print(f"[DEBUG] Truy vấn (async): {query}")
+        loop = asyncio.get_running_loop()
+        embedding = await loop.run_in_executor(self._executor, self._embed_query, query)
+        return await loop.run_in_executor(
+            self._executor, self._query_index, query, embedding, top_k, threshold
+        )
+
 
     # ======================
     #      Generate answer
     # ======================
-    def generate_response(self, query):
-        print("[DEBUG] Gọi generate_response()")
-
-        # ƯU TIÊN trả về raw Điều X
-        raw_article = self.search_raw_article(query)
-        if raw_article:
-            return raw_article
-
-        # Ngược lại → dùng RAG
+    def _cached_response(self, query):
         # Check response cache first to return instantly for repeated queries
-        if query in self._response_cache:
-            resp = self._response_cache.pop(query)
+        key = self._cache_key(query)
+        if key in self._response_cache:
+            resp = self._response_cache.pop(key)
             # mark as recently used
-            self._response_cache[query] = resp
+            self._response_cache[key] = resp
             print("[DEBUG] Trả về từ response cache")
             return resp
+        if key in self._warm_cache["responses"]:
+            print("[DEBUG] Trả về từ warm cache")
+            return self._warm_cache["responses"][key]
+        return None
 
-        docs = self.retrieve_relevant_docs(query)
+    def _cache_response(self, query, answer):
+        try:
+            self._response_cache[self._cache_key(query)] = answer
+            if len(self._response_cache) > self._response_cache_max:
+                self._response_cache.popitem(last=False)
+        except Exception:
+            pass
 
-        # If top match is very confident, return the source text directly
-        if docs and len(docs) > 0 and docs[0].get("score", 0) >= 0.82:
-            print("[DEBUG] High-confidence match found — returning source snippet without calling LLM")
-            return docs[0]["metadata"]["text"]
+    def _build_payload(self, query, docs, stateless=False):
         # Join only top docs' text and truncate to a reasonable size to
         # avoid sending huge payloads to the model which slows responses.
-        context = " ".join([d["metadata"]["text"] for d in docs[:5]])
+        texts = [self._doc_text(d) for d in docs[:5]]
+        context = " ".join([t for t in texts if t])
         max_context_chars = 3500
         if len(context) > max_context_chars:
             context = context[-max_context_chars:]
 
         print(f"[DEBUG] Độ dài context gửi vào model: {len(context)}")
 
-        input_text = f"""
-            Bạn là chuyên gia rất am hiểu về Luật BHYT. Dựa trên Ngữ cảnh được cung cấp bên dưới, trả lời câu hỏi một cách thật chính xác và ngắn gọn.
-            BẮT BUỘC phải trích dẫn điều luật chính xác nếu có trong ngữ cảnh (Không được sai sót về số điều luật). 
-            Ngữ cảnh: {context}
-            Câu hỏi: {query}
-        """
+        input_text = PROMPT_TEMPLATE.format(context=context, query=query)
 
-        payload = {
-            "model": "llama3.1",
+        return {
+            "model": OLLAMA_MODEL,
             "prompt": input_text,
-            "context": self.context,
+            "context": [] if stateless else self.context,
             "stream": False,
         }
 
-        print(f"[DEBUG] Gửi request tới Ollama...")
-        response = self.http.post(url="http://localhost:11434/api/generate", json=payload)
-        response = response.json()
-
+    def _parse_model_response(self, response, stateless=False):
         print("[DEBUG] Nhận phản hồi từ model!")
 
-        self.context = response.get("context", self.context)
-        answer = response.get("response") or response.get("output") or ""
+        if not stateless:
+            self.context = response.get("context", self.context)
+        return response.get("response") or response.get("output") or ""
+
+    def generate_response(self, query):
+        print("[DEBUG] Gọi generate_response()")
+
+        # ƯU TIÊN trả về raw Điều X
+        raw_article = self.search_raw_article(query)
+        if raw_article:
+            return raw_article
+
+        # Ngược lại → dùng RAG
+        self._log_query(query)
+        cached = self._cached_response(query)
+        if cached is not None:
+            return cached
+
+        docs = self.retrieve_relevant_docs(query)
+
+        # If top match is very confident, return the source text directly
+        if docs and len(docs) > 0 and docs[0].get("score", 0) >= 0.82:
+            snippet = self._doc_text(docs[0])
+            if snippet:
+                print("[DEBUG] High-confidence match found — returning source snippet without calling LLM")
+                return snippet
+
+        payload = self._build_payload(query, docs)
+
+        print(f"[DEBUG] Gửi request tới Ollama...")
+        response = self.http.post(
+            url=f"{OLLAMA_HOST}/api/generate", json=payload, timeout=OLLAMA_TIMEOUT
+        )
+        answer = self._parse_model_response(response.json())
 
         # Save to response cache
-        try:
-            self._response_cache[query] = answer
-            if len(self._response_cache) > self._response_cache_max:
-                self._response_cache.popitem(last=False)
-        except Exception:
-            pass
+        self._cache_response(query, answer)
+
+        return answer
+
+
+    # ======================
+    #   Async (ASGI) path
+    # ======================
+    def _get_async_http(self):
+        if self._async_http is None or self._async_http.is_closed:
+            self._async_http = httpx.AsyncClient(
+                base_url=OLLAMA_HOST,
+                timeout=httpx.Timeout(OLLAMA_TIMEOUT, connect=5.0),
+                limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+                transport=httpx.AsyncHTTPTransport(retries=3),
+            )
+        return self._async_http
+
+    async def agenerate_response(self, query):
+        print("[DEBUG] Gọi agenerate_response()")
+
+        # search_raw_article is pure in-memory work (fuzzy match + regex), cheap
+        # enough to run directly on the event loop.
+        raw_article = self.search_raw_article(query)
+        if raw_article:
+            return raw_article
+
+        self._log_query(query)
+        cached = self._cached_response(query)
+        if cached is not None:
+            return cached
+
+        docs = await self.aretrieve_relevant_docs(query)
+
+        if docs and len(docs) > 0 and docs[0].get("score", 0) >= 0.82:
+            snippet = self._doc_text(docs[0])
+            if snippet:
+                print("[DEBUG] High-confidence match found — returning source snippet without calling LLM")
+                return snippet
+
+        # Stateless: concurrent chats must not share one Ollama conversation
+        payload = self._build_payload(query, docs, stateless=True)
+
+        print(f"[DEBUG] Gửi request tới Ollama (async)...")
+        response = await self._get_async_http().post("/api/generate", json=payload)
+        response.raise_for_status()
+        answer = self._parse_model_response(response.json(), stateless=True)
+
+        self._cache_response(query, answer)
 
         return answer
+
+    async def aclose(self):
+        """Release the async HTTP client and the executor pool."""
+        self.flush_query_log()
+        if self._async_http is not None:
+            await self._async_http.aclose()
+            self._async_http = None
+        self._executor.shutdown(wait=False)
+
+
+    # ======================
+    #   Warm cache (offline)
+    # ======================
+    def _data_fingerprint(self):
+        # Identifies the data, models and prompt the warm cache was computed from
+        digest = hashlib.sha256()
+        for part in (self.index_name, EMBEDDING_MODEL, OLLAMA_MODEL, PROMPT_TEMPLATE):
+            digest.update(part.encode("utf-8") + b"\0")
+        for file in sorted(os.listdir(self.data_folder)):
+            if file.endswith(".txt"):
+                digest.update(file.encode("utf-8"))
+                with open(os.path.join(self.data_folder, file), "rb") as f:
+                    digest.update(f.read())
+        return digest.hexdigest()
+
+    def _load_warm_cache(self):
+        self._warm_cache = {"embeddings": {}, "retrieval": {}, "responses": {}}
+        if not os.path.exists(self._warm_cache_path):
+            return
+        try:
+            with open(self._warm_cache_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("fingerprint") != self._data_fingerprint():
+                print("[DEBUG] Warm cache không khớp dữ liệu hiện tại → bỏ qua")
+                return
+            for key in self._warm_cache:
+                self._warm_cache[key] = data.get(key, {})
+            print(f"[DEBUG] Load warm cache: {len(self._warm_cache['responses'])} câu trả lời")
+        except Exception as e:
+            print(f"[DEBUG] Không đọc được warm cache: {e}")
+
+    def _save_warm_cache(self, cache):
+        tmp_path = self._warm_cache_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({**cache, "fingerprint": self._data_fingerprint()}, f, ensure_ascii=False)
+        os.replace(tmp_path, self._warm_cache_path)
+
+    def _clear_warm_cache(self):
+        self._warm_cache = {"embeddings": {}, "retrieval": {}, "responses": {}}
+        if os.path.exists(self._warm_cache_path):
+            os.remove(self._warm_cache_path)
+            print("[DEBUG] Đã xoá warm cache cũ")
+
+    def _log_query(self, query):
+        with self._query_log_lock:
+            self._query_log_buffer.append(self._cache_key(query))
+            if len(self._query_log_buffer) < QUERY_LOG_FLUSH_EVERY:
+                return
+            lines, self._query_log_buffer = self._query_log_buffer, []
+        try:
+            self._executor.submit(self._write_query_log, lines)
+        except RuntimeError:
+            # Executor already shut down
+            self._write_query_log(lines)
+
+    def _write_query_log(self, lines):
+        try:
+            with self._query_log_file_lock:
+                with open(self._query_log_path, "a", encoding="utf-8") as f:
+                    f.write("\n".join(lines) + "\n")
+                # Keep at most one rotated file so the log stays bounded
+                if os.path.getsize(self._query_log_path) > QUERY_LOG_MAX_BYTES:
+                    os.replace(self._query_log_path, self._query_log_path + ".1")
+        except Exception as e:
+            print(f"[DEBUG] Không ghi được query log: {e}")
+
+    def flush_query_log(self):
+        with self._query_log_lock:
+            lines, self._query_log_buffer = self._query_log_buffer, []
+        if lines:
+            self._write_query_log(lines)
+
+    def top_logged_queries(self, n=50):
+        self.flush_query_log()
+        counts = Counter()
+        for path in (self._query_log_path + ".1", self._query_log_path):
+            if os.path.exists(path):
+                with open(path, "r", encoding="utf-8") as f:
+                    counts.update(line.strip() for line in f if line.strip())
+        return [q for q, _ in counts.most_common(n)]
+
+    def seed_queries(self, top_n=50):
+        """Article titles from law.txt and the top-N logged queries.
+
+        qa.txt questions are not seeded: they are answered by the fuzzy QA
+        lookup before the caches are consulted."""
+        seeds = []
+
+        # Article titles without the "Điều N." prefix, so they take the RAG path
+        # instead of being answered by the raw article lookup.
+        law_path = os.path.join(self.data_folder, "law.txt")
+        if os.path.exists(law_path):
+            with open(law_path, "r", encoding="utf-8") as f:
+                titles = re.findall(r"^Điều\s+\d+[a-z]?\.\s*(.+?)\s*$", f.read(), re.MULTILINE)
+            # Drop footnote markers like "[25]" that users never type
+            seeds += [re.sub(r"\[\d+\]", "", t) for t in titles]
+
+        seeds += self.top_logged_queries(top_n)
+        return list(dict.fromkeys(self._cache_key(s) for s in seeds if s.strip()))
+
+    def _warm_one(self, query, embedding, cache, top_k=3, threshold=0.35):
+        matches = self._fetch_matches(embedding, top_k)
+        cache["retrieval"][query] = {"top_k": top_k, "matches": matches}
+
+        docs = [m for m in matches if m["score"] >= threshold]
+        # High-confidence queries are answered from the snippet, no LLM needed
+        if docs and docs[0]["score"] >= 0.82:
+            return
+
+        payload = self._build_payload(query, docs, stateless=True)
+        response = self.http.post(
+            url=f"{OLLAMA_HOST}/api/generate", json=payload, timeout=OLLAMA_TIMEOUT
+        )
+        response.raise_for_status()
+        cache["responses"][query] = self._parse_model_response(response.json(), stateless=True)
+
+    def warm_up(self, top_n=50, workers=None):
+        """Precompute embeddings, retrieval results and answers for the seed
+        workload and persist them, so the first real users hit warm caches."""
+        workers = workers or int(os.getenv("RAG_WARMUP_WORKERS", "4"))
+        seeds = self.seed_queries(top_n)
+        # Queries answered by qa.txt / concepts / raw articles never reach the LLM
+        pending = [q for q in seeds if not self.search_raw_article(q)]
+        print(f"[DEBUG] Warm-up: {len(seeds)} seed, {len(pending)} cần tính trước")
+
+        cache = {"embeddings": {}, "retrieval": {}, "responses": {}}
+        if pending:
+            embeddings = self.vector_model.encode(pending, batch_size=32).tolist()
+            cache["embeddings"] = dict(zip(pending, embeddings))
+
+            failed = 0
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="warmup") as pool:
+                futures = {
+                    pool.submit(self._warm_one, q, e, cache): q
+                    for q, e in zip(pending, embeddings)
+                }
+                for i, future in enumerate(futures):
+                    try:
+                        future.result()
+                    except Exception as e:
+                        failed += 1
+                        print(f"[DEBUG] Warm-up lỗi với '{futures[future]}': {e}")
+                    if (i + 1) % 20 == 0:
+                        print(f"[DEBUG] ...warm-up {i + 1}/{len(pending)}")
+            print(f"[DEBUG] Warm-up lỗi: {failed}")
+
+        self._save_warm_cache(cache)
+        self._warm_cache = cache
+        print(f"[DEBUG] Warm-up hoàn tất: {len(cache['responses'])} câu trả lời đã lưu")
+        return cache
@@ -0,0 +1,42 @@
+from chunk_store import ChunkStore
+
+
+def test_missing_store_is_unavailable(tmp_path):
+    store = ChunkStore(str(tmp_path / "chunks"))
+
+    assert not store.available
+    assert store.get("1-0") is None
+
+
+def test_last_duplicate_wins(tmp_path):
+    store = ChunkStore(str(tmp_path / "chunks"))
+    store.build([("1-0", "Điều 1. cũ"), ("1-1", "b"), ("1-0", "Điều 1. mới"), ("2-0", "")])
+
+    assert store.get("1-0") == "Điều 1. mới"
+    assert store.get("1-1") == "b"
+    assert store.get("2-0") == ""
+    assert store.get("9-9") is None
+
+
+def test_rebuild_while_slice_held(tmp_path):
+    store = ChunkStore(str(tmp_path / "chunks"))
+    store.build([("1-0", "bảo hiểm y tế")])
+    held = store._state[2][0:4]
+
+    store.build([("1-0", "phiên bản mới")])
+
+    assert bytes(held) == "bảo hiểm y tế".encode("utf-8")[:4]
+    assert store.get("1-0") == "phiên bản mới"
+
+
+def test_other_instance_picks_up_new_version(tmp_path):
+    folder = str(tmp_path / "chunks")
+    writer = ChunkStore(folder)
+    writer.build([("1-0", "cũ")])
+    reader = ChunkStore(folder)
+    assert reader.get("1-0") == "cũ"
+
+    writer.build([("1-0", "mới")])
+    reader._next_check = 0.0
+
+    assert reader.get("1-0") == "mới"
@@ -0,0 +1,27 @@
+"""
+Offline cache warm-up for the RAG Chatbot
+Precomputes answers for article titles and the top logged queries.
+Usage: python warmup.py [--index] [--top-n 50] [--workers 4]
+"""
+import argparse
+from processing import RAG
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Warm RAG caches offline")
+    parser.add_argument("--index", action="store_true", help="re-create the vector DB first")
+    parser.add_argument("--top-n", type=int, default=50, help="number of top logged queries to seed")
+    parser.add_argument("--workers", type=int, default=None, help="parallel Ollama requests")
+    args = parser.parse_args()
+
+    rag = RAG()
+
+    if args.index:
+        print("[DEBUG] Bắt đầu tạo VectorDB...")
+        rag.create_vectordb(warm=False)
+
+    rag.warm_up(top_n=args.top_n, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()